@@ -55,6 +55,8 @@ so switched to straightforward but less direct boto3 .upload_file()
 
 """
 import s3staging as s3s
+import httpclient
+import ratelimit
 import requests
 import re
 import os
@@ -80,7 +82,7 @@ def get_CDAWEB_filelist(dataid, time1, time2):
     url = "https://cdaweb.gsfc.nasa.gov/WS/cdasr/1/dataviews/sp_phys/datasets/"
     url += dataid + "/orig_data/" + ttime1 + "," + ttime2
     try:
-        res = requests.get(url, headers=headers)
+        res = httpclient.get(url, headers=headers)
         stat = res.status_code
     except:
         stat = -1
@@ -118,7 +120,7 @@ def get_CDAWEB_IDs(fname, dataid=None, webfetch=True):
 
     headers = {"Accept": "application/json"}
     if webfetch:
-        res = requests.get(url, headers=headers)
+        res = httpclient.get(url, headers=headers)
         if res.status_code == 200:
             try:
                 j = res.json()
@@ -224,7 +226,8 @@ def fetchCDAWebsinglet(dataid, time1=None, time2=None):
 
 
 def cdaweb_prod(
-    threads=1, logfile=None, loglevel=None, refreshIDs=False, limit=None, test=True, stripMMS=False
+    threads=1, logfile=None, loglevel=None, refreshIDs=False, limit=None, test=True, stripMMS=False,
+    ratelimits=None, connlimits=None
 ):
     """
     threads
@@ -233,6 +236,9 @@ def cdaweb_prod(
     refreshIDs
     limit = fetch no more than 'limit' IDs, default None = get all cdaweb
     test = pulls only a subset of IDs over a truncated time range
+    ratelimits = {host: [bytes/sec, requests/sec]} shared by all threads,
+        e.g. {"cdaweb.gsfc.nasa.gov": [50000000, 20]}, see ratelimit.py
+    connlimits = {host: max open connections}, see httpclient.py
     """
 
     """ can be easily parallelized to 1 dataset per thread.
@@ -251,6 +257,11 @@ def cdaweb_prod(
     logstr1 = f"logfile {logfile}, loglevel {loglevel}, threads {threads},"
     logstr2 = f"limit {limit}, refreshIDs {refreshIDs}, test {test}, stripMMS {stripMMS}"
     s3s.logme(logstr1, logstr2, "log")
+    if ratelimits:
+        ratelimit.configure(ratelimits)
+        s3s.logme("Rate limits", ratelimits, "log")
+    # one keep-alive connection per thread, shared across datasets
+    httpclient.configure(pool_size=max(10, threads), host_limits=connlimits)
 
     sinfo, allIDs, allIDs_meta = load_cdaweb_params(webfetch=webfetch)
 
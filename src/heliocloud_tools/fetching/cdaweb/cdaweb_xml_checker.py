@@ -1,8 +1,11 @@
 import xml.etree.ElementTree as ET
+import calendar
+import hashlib
+import json
 import os
 import requests
 import re
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from collections import defaultdict
 
 """
@@ -10,9 +13,39 @@ Parsing via https://spdf.gsfc.nasa.gov/pub/catalogs/00readme.txt
 Note they say the 'all.xml' is incomplete, so for unlisted items
 we do a best guess on YYYYMMDD.
 
+Time regexes are compiled once (at load_fromxml time, or on first use
+for guessed patterns) and kept in global_compiled, since the thousands
+of distinct CDAWeb patterns overflow the small internal 're' cache.
+
+The maps parsed from all.xml are memoized per run and also saved as
+JSON to all.xml.cache.json, so unchanged catalogs load without
+re-parsing.  JSON rather than pickle, so whoever can write beside
+all.xml can at worst feed us bad patterns, never code.
+A cold parse streams the file with iterparse rather than building a DOM.
 """
 
-def load_fromxml(homepath = ".", strip_me = None):
+# regex string -> (compiled, compiled IGNORECASE), or None if it will not compile
+global_compiled = {}
+# [regex_base, path trie, number of bases in the trie] for the last few
+# regex_base dicts seen, matched by identity (the entry holds the dict,
+# so it stays the same object for as long as it is cached)
+global_tries = []
+global_tries_max = 4
+# (all.xml path, strip_me, mtime, size, cache version) -> (regex_base, regex_pattern)
+global_xml_memo = {}
+# bump whenever parsing or strftime_to_regex changes what the maps hold,
+# so caches written by older code are re-parsed rather than trusted
+xml_cache_version = 2
+
+def load_fromxml(homepath = ".", strip_me = None, cache = True):
+    """Returns the regex_base, regex_pattern maps derived from all.xml.
+    Repeat calls within a run reuse the memoized maps, and with
+    cache=True the maps are also saved as JSON next to all.xml, keyed on
+    xml_cache_version and the file's mtime/size and sha1, so an unchanged
+    all.xml is not re-parsed.
+    Each call gets its own copies, so the dataids extract_regex guesses
+    and adds while ingesting do not turn up in later steps.
+    """
     # Define file name and URL
     FILE_NAME = f"{homepath}/all.xml"
     FILE_URL = "https://spdf.gsfc.nasa.gov/pub/catalogs/all.xml"
@@ -24,6 +57,83 @@ def load_fromxml(homepath = ".", strip_me = None):
         with open(FILE_NAME, "wb") as file:
             file.write(response.content)
 
+    fstat = os.stat(FILE_NAME)
+    memokey = (os.path.abspath(FILE_NAME), strip_me, fstat.st_mtime_ns, fstat.st_size,
+               xml_cache_version)
+    if memokey in global_xml_memo:
+        regex_base, regex_pattern = global_xml_memo[memokey]
+        regex_base, regex_pattern = dict(regex_base), dict(regex_pattern)
+        prefix_trie(regex_base)
+        return regex_base, regex_pattern
+
+    maps = None
+    if cache:
+        maps = load_xml_cache(FILE_NAME, strip_me, fstat)
+    if maps == None:
+        maps = parse_allxml(FILE_NAME, strip_me)
+        if cache:
+            save_xml_cache(FILE_NAME, strip_me, fstat, maps)
+    regex_base, regex_pattern = maps
+
+    compile_patterns(regex_pattern)
+    global_xml_memo[memokey] = (regex_base, regex_pattern)
+    regex_base, regex_pattern = dict(regex_base), dict(regex_pattern)
+    prefix_trie(regex_base)
+    return regex_base, regex_pattern
+
+def parse_allxml(FILE_NAME, strip_me = None, stream = True):
+    """Streams the <dataset> elements of all.xml into the
+    regex_base, regex_pattern maps.  Each dataset is dropped from the
+    tree as soon as it is read, so memory stays flat however large the
+    catalog gets.  stream=False uses the older whole-DOM parse.
+    """
+    if not stream:
+        return dom_parse_allxml(FILE_NAME, strip_me)
+
+    regex_base = {}
+    regex_pattern = {}
+    namespace = None
+    stack = []
+    for event, elem in ET.iterparse(FILE_NAME, events=("start", "end")):
+        if event == "start":
+            if namespace == None:
+                # Extract namespace dynamically from the root tag
+                namespace = elem.tag.split("}")[0].strip("{")
+                ns_map = {"cdas": namespace}
+                dataset_tag = f"{{{namespace}}}dataset"
+            stack.append(elem)
+            continue
+        stack.pop()
+        if elem.tag != dataset_tag:
+            continue
+        dataset_to_maps(elem, ns_map, strip_me, regex_base, regex_pattern)
+        # done with this dataset, so drop it from the tree
+        elem.clear()
+        if stack:
+            stack[-1].remove(elem)
+
+    return regex_base, regex_pattern
+
+def dataset_to_maps(dataset, ns_map, strip_me, regex_base, regex_pattern):
+    # Extract serviceprovider_ID from dataset attributes
+    dataid = dataset.attrib.get("serviceprovider_ID", "").strip()
+
+    # Extract URL and filenaming from inside <access>
+    access_element = dataset.find(".//cdas:access", ns_map)
+    if access_element is not None:
+        url_element = access_element.find("cdas:URL", ns_map)
+        filenaming = access_element.attrib.get("filenaming", "").strip()
+
+        if url_element is not None:
+            url_text = url_element.text.strip()
+            if url_text.startswith("https://cdaweb"):
+                url_cleaned = re.sub(r"https://.*?.nasa.gov/", "", url_text)  # Remove web address
+                if strip_me != None:
+                    url_cleaned = re.sub(f"^{strip_me}","",url_cleaned)
+                regex_base[dataid] = url_cleaned
+                regex_pattern[dataid] = strftime_to_regex(filenaming)
+
+def dom_parse_allxml(FILE_NAME, strip_me = None):
     # Parse XML from the local file
     with open(FILE_NAME, "r", encoding="utf-8") as file:
         tree = ET.parse(file)
@@ -39,27 +149,86 @@ def load_fromxml(homepath = ".", strip_me = None):
 
     # Iterate over dataset elements
     for dataset in root.findall(".//cdas:dataset", ns_map):
-        # Extract serviceprovider_ID from dataset attributes
-        dataid = dataset.attrib.get("serviceprovider_ID", "").strip()
-
-        # Extract URL and filenaming from inside <access>
-        access_element = dataset.find(".//cdas:access", ns_map)
-        if access_element is not None:
-            url_element = access_element.find("cdas:URL", ns_map)
-            filenaming = access_element.attrib.get("filenaming", "").strip()
-        
-            if url_element is not None:
-                url_text = url_element.text.strip()
-                if url_text.startswith("https://cdaweb"):
-                    url_cleaned = re.sub(r"https://.*?.nasa.gov/", "", url_text)  # Remove web address
-                    if strip_me != None:
-                        url_cleaned = re.sub(f"^{strip_me}","",url_cleaned)
-                    regex_base[dataid] = url_cleaned
-                    regex_pattern[dataid] = strftime_to_regex(filenaming)
-                    
+        dataset_to_maps(dataset, ns_map, strip_me, regex_base, regex_pattern)
+
     #print(len(regex_base.keys()),len(regex_pattern.keys()))
     return regex_base, regex_pattern
 
+def xml_cache_name(FILE_NAME):
+    # always beside all.xml itself, however the caller got there
+    return os.path.abspath(FILE_NAME) + ".cache.json"
+
+def file_sha1(fname):
+    sha1 = hashlib.sha1()
+    with open(fname, "rb") as fin:
+        for block in iter(lambda: fin.read(1 << 20), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+def read_xml_cache(cachename):
+    # the cache dict if it is ours and of this version, else None
+    try:
+        with open(cachename, "r", encoding="utf-8") as fin:
+            xcache = json.load(fin)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(xcache, dict) or xcache.get("version") != xml_cache_version:
+        return None
+    return xcache
+
+def load_xml_cache(FILE_NAME, strip_me, fstat):
+    # returns cached (regex_base, regex_pattern) if all.xml is unchanged, else None
+    xcache = read_xml_cache(xml_cache_name(FILE_NAME))
+    try:
+        regex_base, regex_pattern = xcache["maps"][json.dumps(strip_me)]
+    except (TypeError, KeyError, ValueError):
+        return None
+    if not isinstance(regex_base, dict) or not isinstance(regex_pattern, dict):
+        return None
+    maps = (regex_base, regex_pattern)
+    if xcache.get("mtime") == fstat.st_mtime_ns and xcache.get("size") == fstat.st_size:
+        return maps
+    # touched but maybe not changed, so fall back to the content hash
+    if xcache.get("sha1") == file_sha1(FILE_NAME):
+        return maps
+    return None
+
+def save_xml_cache(FILE_NAME, strip_me, fstat, maps):
+    cachename = xml_cache_name(FILE_NAME)
+    sha1 = file_sha1(FILE_NAME)
+    xcache = read_xml_cache(cachename)
+    if xcache == None or xcache.get("sha1") != sha1 or not isinstance(xcache.get("maps"), dict):
+        xcache = {"maps": {}}  # maps for other strip_me values are stale
+    xcache.update({"version": xml_cache_version, "mtime": fstat.st_mtime_ns,
+                   "size": fstat.st_size, "sha1": sha1})
+    # JSON keys are strings, so strip_me goes in as its JSON (None is "null")
+    xcache["maps"][json.dumps(strip_me)] = list(maps)
+    try:
+        with open(cachename + ".tmp", "w", encoding="utf-8") as fout:
+            json.dump(xcache, fout)
+        os.replace(cachename + ".tmp", cachename)
+    except OSError as e:
+        print(f"Warning, could not save {cachename}: {e}")
+
+def compile_pattern(regex_pattern):
+    # returns the cached (case-sensitive, case-insensitive) compiled pair
+    try:
+        return global_compiled[regex_pattern]
+    except KeyError:
+        pass
+    try:
+        compiled = (re.compile(regex_pattern), re.compile(regex_pattern, re.IGNORECASE))
+    except re.error:
+        compiled = None
+    global_compiled[regex_pattern] = compiled
+    return compiled
+
+def compile_patterns(regex_pattern):
+    # precompiles every time regex in a regex_pattern map
+    for x_regex in regex_pattern.values():
+        if x_regex:
+            compile_pattern(x_regex)
+
 def guess_regex(basename):
     patterns = ["_%Y%m%d%H%M%S_",
                 "_%Y%m%d%H%M_",
@@ -160,7 +329,7 @@ def extract_regex(regex_base, regex_pattern, fullname):
                 return dataid, base, x_regex
             except:
                 pass
-    dataid, base, x_regex = slow_extract_regex(regex_base, regex_pattern, fullname)
+    dataid, base, x_regex = trie_extract_regex(regex_base, regex_pattern, fullname)
     if dataid != None:
         return dataid, base, x_regex
     # not in 'all.xml', so let us add it
@@ -172,6 +341,7 @@ def extract_regex(regex_base, regex_pattern, fullname):
     base = os.path.dirname(fullname)
     regex_base[dataid] = base
     regex_pattern[dataid] = x_regex
+    add_to_trie(regex_base, dataid, base)
     return dataid, base, x_regex
 
 def slow_extract_regex(regex_base, regex_pattern, fullname):
@@ -190,6 +360,86 @@ def slow_extract_regex(regex_base, regex_pattern, fullname):
 
     return None, None, None  # No match found
 
+def trie_entry(regex_base):
+    # the cached [regex_base, trie, count] for this very dict, or None
+    for entry in global_tries:
+        if entry[0] is regex_base:
+            return entry
+    return None
+
+def prefix_trie(regex_base):
+    """Returns the path trie for this regex_base, building it on first use.
+    Each node is a dict of path component -> child node, and the None key
+    holds the dataids whose base ends at that node (in regex_base order).
+    """
+    entry = trie_entry(regex_base)
+    if entry == None or entry[2] != len(regex_base):
+        trie = {}
+        for dataid, base in regex_base.items():
+            node = trie
+            for part in base.split("/"):
+                if part:
+                    node = node.setdefault(part, {})
+            node.setdefault(None, []).append(dataid)
+        if entry == None:
+            entry = [regex_base, trie, len(regex_base)]
+            global_tries.insert(0, entry)
+            del global_tries[global_tries_max:]
+        else:
+            entry[1:] = [trie, len(regex_base)]
+    return entry[1]
+
+def add_to_trie(regex_base, dataid, base):
+    # keeps the trie in step when extract_regex adds a guessed dataid
+    entry = trie_entry(regex_base)
+    if entry == None or entry[2] != len(regex_base) - 1:
+        prefix_trie(regex_base)  # out of step, just rebuild
+        return
+    node = entry[1]
+    for part in base.split("/"):
+        if part:
+            node = node.setdefault(part, {})
+    node.setdefault(None, []).append(dataid)
+    entry[2] += 1
+
+def trie_extract_regex(regex_base, regex_pattern, fullname):
+    """Same job as slow_extract_regex, but walks the path trie so the cost
+    is O(path depth) instead of O(#datasets).  Candidates are tried
+    longest (most specific) base first.
+
+    Note this is not quite the old lookup.  slow_extract_regex takes the
+    first base, in all.xml order, that is a string prefix of fullname;
+    here bases match on whole path components and the longest wins.  So
+    where one dataset's base is nested inside another's, the inner one
+    is now chosen whatever the all.xml order, and a base such as
+    'a/set1' no longer claims files under 'a/set10/'.  Otherwise the
+    two agree (see tests/test_xml_lookup.py).
+    """
+    basename = os.path.basename(fullname)
+    node = prefix_trie(regex_base)
+    candidates = [node[None]] if None in node else []
+    for part in fullname.split("/")[:-1]:
+        if not part:
+            continue
+        node = node.get(part)
+        if node == None:
+            break
+        if None in node:
+            candidates.append(node[None])
+    for dataids in reversed(candidates):
+        for dataid in dataids:
+            x_regex = regex_pattern[dataid]
+            # also ensuring the date regex will work later
+            x_regex_alt = regex_pattern.get(f"{dataid}_alt")
+            if x_regex_alt == None:
+                x_regex_alt = re.sub(r"\(.*\)", ".*", x_regex)
+                regex_pattern[f"{dataid}_alt"] = x_regex_alt
+            compiled = compile_pattern(x_regex_alt)
+            if compiled != None and compiled[0].search(basename):
+                return dataid, regex_base[dataid], x_regex
+
+    return None, None, None  # No match found
+
 def strftime_to_regex(pattern):
     # Replace %Q fields with ".*" as they are not date-related                  
     pattern = re.sub(r"%Q[0-9]*", ".*", pattern)
@@ -229,17 +479,19 @@ def strftime_to_regex(pattern):
 
 # Function to extract datetime from filename using filenaming pattern
 def extract_datetime(filename, regex_pattern, form='dt'):
+    if form == "str":
+        return fast_extract_datetime(filename, regex_pattern)
     if not regex_pattern:
         return None  # No valid pattern provided
-    match = re.search(regex_pattern, filename)
+    compiled = compile_pattern(regex_pattern)
+    if compiled == None:
+        return None
+    match = compiled[0].search(filename)
 
     if match == None:
         # somewhat iffy, there are some with 't' instead of 'T' etc
-        match = re.search(regex_pattern, filename, re.IGNORECASE)
+        match = compiled[1].search(filename)
 
-    #except:
-    #    print(regex_pattern, filename)
-    #    exit()
     if match:
         try:
             year = int(match.group("year"))
@@ -260,10 +512,7 @@ def extract_datetime(filename, regex_pattern, form='dt'):
                 int(match.group("minute")) if "minute" in match.groupdict() else 0,
                 int(match.group("second")) if "second" in match.groupdict() else 0
             )
-            if form == "str":
-                return mydate.strftime("%Y-%m-%dT%H:%M:%SZ")
-            else:
-                return mydate
+            return mydate
 
         except: # ValueError:
             if '?P' not in regex_pattern:
@@ -274,6 +523,49 @@ def extract_datetime(filename, regex_pattern, form='dt'):
 
     return None  # No match found
 
+def fast_extract_datetime(filename, regex_pattern):
+    """Same result as extract_datetime(form="str"), but builds the
+    YYYY-MM-DDTHH:MM:SSZ string straight from the match groups
+    instead of going through a datetime and strftime.  The one
+    difference is years before 1000, always zero padded here where
+    strftime's %Y leaves them unpadded on some platforms.
+    """
+    if not regex_pattern:
+        return None  # No valid pattern provided
+    compiled = compile_pattern(regex_pattern)
+    if compiled == None:
+        return None
+    match = compiled[0].search(filename)
+    if match == None:
+        # somewhat iffy, there are some with 't' instead of 'T' etc
+        match = compiled[1].search(filename)
+        if match == None:
+            return None  # No match found
+
+    groups = match.groupdict()
+    try:
+        year = int(groups["year"])
+        month = int(groups["month"]) if "month" in groups else 1
+        day = int(groups["day"]) if "day" in groups else 1
+        if "doy" in groups:
+            date_from_doy = date(year, 1, 1) + timedelta(days=int(groups["doy"]) - 1)
+            month, day = date_from_doy.month, date_from_doy.day
+        hour = int(groups["hour"]) if "hour" in groups else 0
+        minute = int(groups["minute"]) if "minute" in groups else 0
+        second = int(groups["second"]) if "second" in groups else 0
+    except (KeyError, TypeError, ValueError, OverflowError):
+        # no year group, or a group that did not take part in the match
+        if '?P' not in regex_pattern:
+            # regex has no data info, so not our problem
+            return "0000"
+        return None
+    # same range checks datetime() would apply
+    if (year < 1 or month < 1 or month > 12 or day < 1
+            or day > calendar.monthrange(year, month)[1]
+            or hour > 23 or minute > 59 or second > 59):
+        return None  # Invalid date components
+    return f"{year:04d}-{month:02d}-{day:02d}T{hour:02d}:{minute:02d}:{second:02d}Z"
+
 # Test case
 def test_case():
     log_entry = "2003-12-16T19:59:22.0000000000 GMT     189952 pub/data/isis/topside_sounder/ionogram_cdf/isis1/ODG_14N_359E/1969/345/i1_av_odg_1969345140242_v01.cdf"
@@ -0,0 +1,112 @@
+"""
+Process-wide HTTP connection pools for the fetchers, so keep-alive
+connections (and their TLS handshakes) carry over between files,
+datasets and threads instead of each call making its own.
+
+    import httpclient
+    httpclient.configure(pool_size=8, host_limits={"cdaweb.gsfc.nasa.gov": 4})
+    res = httpclient.get(url, headers=headers)
+
+pool_size should be at least the thread count, or connections get
+dropped and re-made.  Connection errors and 429/5xx answers are retried
+with exponential backoff (urllib3 Retry, honoring Retry-After) for
+GET/HEAD; after the last retry the error response itself comes back,
+so status_code checks work as before.  host_limits caps the open
+connections to a host, extra requests wait for a free one.
+
+Each thread gets its own requests.Session, as a Session is not
+documented as thread-safe, but all of them mount the same adapters, so
+the connection pools (thread-safe in urllib3) and their limits are
+shared.  Don't close() a session from here, that closes the adapters
+under every thread.
+"""
+
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+global_settings = {
+    "pool_size": 10,
+    "retries": 5,
+    "backoff": 0.5,
+    "timeout": 60,
+    "host_limits": {},
+}
+global_adapters = None
+global_generation = 0
+global_lock = threading.Lock()
+global_local = threading.local()
+
+
+def configure(pool_size=None, retries=None, backoff=None, timeout=None, host_limits=None):
+    """Changes any of the given settings (others are kept) and drops the
+    current adapters, so the next session() in any thread is built with them.
+    """
+    global global_adapters, global_generation
+    with global_lock:
+        for key, value in [("pool_size", pool_size), ("retries", retries), ("backoff", backoff),
+                           ("timeout", timeout), ("host_limits", host_limits)]:
+            if value != None:
+                global_settings[key] = value
+        if global_adapters != None:
+            for adapter in set(adapter for prefix, adapter in global_adapters):
+                adapter.close()
+            global_adapters = None
+            global_generation += 1
+
+
+def make_adapter(pool_size, block=False):
+    # block=True makes pool_size a hard limit rather than a cache size
+    retry = Retry(
+        total=global_settings["retries"],
+        backoff_factor=global_settings["backoff"],
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["HEAD", "GET"],
+        raise_on_status=False,
+    )
+    return HTTPAdapter(
+        pool_connections=max(10, len(global_settings["host_limits"]) + 1),
+        pool_maxsize=pool_size,
+        max_retries=retry,
+        pool_block=block,
+    )
+
+
+def adapters():
+    # the shared (prefix, adapter) mounts and their generation, made on first use
+    global global_adapters
+    with global_lock:
+        if global_adapters == None:
+            adapter = make_adapter(global_settings["pool_size"])
+            mounts = [("https://", adapter), ("http://", adapter)]
+            # most specific mount wins, so these override per host
+            for host, limit in global_settings["host_limits"].items():
+                adapter = make_adapter(limit, block=True)
+                for scheme in ["https", "http"]:
+                    mounts.append((f"{scheme}://{host}/", adapter))
+                    mounts.append((f"{scheme}://{host}:", adapter))
+            global_adapters = mounts
+        return global_generation, global_adapters
+
+
+def session():
+    # this thread's requests.Session over the shared adapters
+    generation, mounts = adapters()
+    if getattr(global_local, "generation", None) != generation:
+        mysession = requests.Session()
+        for prefix, adapter in mounts:
+            mysession.mount(prefix, adapter)
+        global_local.session = mysession
+        global_local.generation = generation
+    return global_local.session
+
+
+def timeout():
+    return global_settings["timeout"]
+
+
+def get(url, **kwargs):
+    # requests.get through this thread's session, with the default timeout
+    kwargs.setdefault("timeout", timeout())
+    return session().get(url, **kwargs)
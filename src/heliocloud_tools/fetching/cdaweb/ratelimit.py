@@ -0,0 +1,139 @@
+"""
+Shared token-bucket rate limits for fetches, per source host.
+
+One set of buckets per process, shared by every thread, so any number
+of workers together stay under the agreed rate for a host, e.g.
+
+    import ratelimit
+    ratelimit.configure({"spdf.gsfc.nasa.gov": [50000000, 20]})
+
+limits 50 MB/s and 20 requests/sec to SPDF in total.  Each host maps to
+[bytes/sec, requests/sec], either can be None for no limit, and "*"
+covers any host not listed.  Hosts with no limit cost nothing.
+
+Callers do ratelimit.request(url) once per request and read through
+ratelimit.wrap(fileobj, url), which takes bytes from the bucket as
+they are read.  Separate processes each get their own buckets.
+"""
+
+import threading
+import time
+import urllib.parse
+
+
+class TokenBucket:
+    """Refills at 'rate' tokens/sec up to 'burst' (default 1 sec's
+    worth).  take() blocks until the tokens are there; a take bigger
+    than the bucket just leaves it in debt, so later takers wait it out.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst) if burst != None else self.rate
+        self.tokens = self.burst
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self, n=1):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            self.tokens -= n
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        # sleep outside the lock, the debt already holds our place
+        if wait > 0:
+            time.sleep(wait)
+
+
+class ThrottledReader:
+    # file-like wrapper that charges each read against a bytes bucket
+    def __init__(self, fileobj, bucket):
+        self.fileobj = fileobj
+        self.bucket = bucket
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        if data:
+            self.bucket.take(len(data))
+        return data
+
+    def readinto(self, buffer):
+        n = self.fileobj.readinto(buffer)
+        if n:
+            self.bucket.take(n)
+        return n
+
+    # seeking moves past bytes without reading them, so nothing to charge
+    # (resumable_upload seeks over the parts S3 already has)
+    def seek(self, offset, whence=0):
+        return self.fileobj.seek(offset, whence)
+
+    def tell(self):
+        return self.fileobj.tell()
+
+    def seekable(self):
+        return self.fileobj.seekable()
+
+    def __getattr__(self, name):
+        return getattr(self.fileobj, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return self.fileobj.__exit__(*args)
+
+
+global_limits = {}
+global_buckets = {}
+global_lock = threading.Lock()
+
+
+def configure(limits):
+    """Sets {host: [bytes/sec, requests/sec]} ("*" for any other host),
+    replacing any earlier limits.  None or {} turns limiting off.
+    """
+    with global_lock:
+        global_limits.clear()
+        global_buckets.clear()
+        if limits:
+            for host, (bytes_rate, request_rate) in limits.items():
+                global_limits[host.lower()] = (bytes_rate, request_rate)
+
+
+def host_of(url):
+    # 'spdf.gsfc.nasa.gov' for https://spdf.gsfc.nasa.gov/pub/..., bucket for s3://
+    return (urllib.parse.urlparse(url).hostname or "").lower()
+
+
+def buckets(url):
+    """(bytes bucket, requests bucket) shared by everything fetching
+    from url's host, either None if that is not limited.
+    """
+    if not global_limits:
+        return None, None
+    host = host_of(url)
+    with global_lock:
+        if host not in global_buckets:
+            bytes_rate, request_rate = global_limits.get(host, global_limits.get("*", (None, None)))
+            global_buckets[host] = (
+                TokenBucket(bytes_rate) if bytes_rate else None,
+                TokenBucket(request_rate) if request_rate else None,
+            )
+        return global_buckets[host]
+
+
+def request(url):
+    # call once per request to url, waits for a request token if limited
+    bucket = buckets(url)[1]
+    if bucket != None:
+        bucket.take(1)
+
+
+def wrap(fileobj, url):
+    # fileobj as is, or throttled to url's host bytes/sec if limited
+    bucket = buckets(url)[0]
+    if bucket == None:
+        return fileobj
+    return ThrottledReader(fileobj, bucket)
@@ -65,6 +65,8 @@ import multiprocessing_logging
 import time
 import shutil
 import urllib.parse
+import httpclient
+import ratelimit
 
 """ General driver routines here, should work for most cases """
 
@@ -179,7 +181,7 @@ def get_lastModified(item):
 def getHAPIIDs(lasttime, catalogurl):
     # no longer needed, we fetch from CDAWeb itself now
     # catalogurl = "https://cdaweb.gsfc.nasa.gov/hapi/catalog"
-    res = requests.get(catalogurl)
+    res = httpclient.get(catalogurl)
     j = res.json()
     if res.status_code == 200:
         return [item["id"] for item in j["catalog"] if get_lastModified(item) > lasttime]
@@ -207,6 +209,37 @@ def s3url_to_bucketkey(s3url: str) -> Tuple[str, str]:
     return mybucket, myfilekey
 
 
+def fetch_url(mysession, url_to_fetch: str, tempfile: str, tries: int = 5) -> bool:
+    """
+    Streams a URL to a local file.  The session's adapter already retries
+    connection errors and 429/5xx; this also retries a body that drops
+    or gets cut off partway, which that does not cover.
+
+    :param mysession: The requests session to fetch with (see httpclient.py).
+    :param url_to_fetch: The URL to fetch.
+    :param tempfile: The local file to write it to.
+    :param tries: How many times to try the download.
+
+    :returns: True if the file was written, False otherwise.
+    """
+    for attempt in range(tries):
+        try:
+            # shared per-host limits, if set via ratelimit.configure()
+            ratelimit.request(url_to_fetch)
+            with mysession.get(url_to_fetch, stream=True, timeout=httpclient.timeout()) as r:
+                r.raise_for_status()
+                with open(tempfile, "wb") as f:
+                    shutil.copyfileobj(ratelimit.wrap(r.raw, url_to_fetch), f)
+            return True
+        except requests.exceptions.HTTPError:
+            # an error answer after the adapter's retries, trying again won't help
+            return False
+        except:
+            # print("Error Timeout, trying again for ",url_to_fetch)
+            time.sleep(1)
+    return False
+
+
 def fetch_and_register(
     filelist: Dict[str, Any], sinfo: Dict[str, Any], logstring: str = ""
 ) -> Tuple[str, List[str]]:
@@ -241,8 +274,8 @@ def fetch_and_register(
     if sinfo["s3staging"].startswith("s3://"):
         mys3 = botoclientwrap(sinfo)
 
-    # start a Session object for efficiency
-    mysession = requests.Session()
+    # this thread's session on the shared pools, so connections carry over between datasets
+    mysession = httpclient.session()
 
     for item in filelist["data"]:
         url_to_fetch = item[filelist["key"]]
@@ -286,57 +319,7 @@ def fetch_and_register(
                 else:
                     # despite being promised as a local file, it does not exist
                     continue
-            remaining_download_tries = 0  # skips the later URI download step
-        else:
-            # normal web fetch
-            remaining_download_tries = 5
-
-        while remaining_download_tries > 0:
-            try:
-                with mysession.get(url_to_fetch, stream=True) as r:
-                    with open(tempfile, "wb") as f:
-                        shutil.copyfileobj(r.raw, f)
-                # print("Wrote ",tempfile)
-                break
-            except:
-                # print("Error Timeout, trying again for ",url_to_fetch)
-                remaining_download_tries -= 1
-                time.sleep(1)
-            """
-            r=mysession.get(url_to_fetch)
-            if r.status_code == 200:
-                try:
-                    with open(tempfile, 'wb') as fd:
-                        fd.write(r.raw)
-                    print("Good: ",r.status_code)
-                    print("Good pt 2: ",r.headers)
-
-                except:
-                    print("***************")
-                    print("Bad: ",r.status_code)
-                    print("Bad pt 2: ",r.headers)
-                    print("Bad pt 3: ",r.raw)
-                    exit()
-            else:
-                error_msg = str(r.status_code) + ' ' + url_to_fetch
-                remaining_download_tries -= 1
-                time.sleep(1)
-            """
-            """ # original version
-            try:
-                urllib.request.urlretrieve(url_to_fetch,tempfile)
-                
-            except urllib.error.URLError as e:
-                #print("FAILED, not got ",url_to_fetch)
-                remaining_download_tries -= 1
-                time.sleep(1)
-                error_msg = e.reason
-                #print("Error ",error_msg," tries is ",remaining_download_tries," for ",url_to_fetch)
-            else:
-                break
-            """
-
-        if remaining_download_tries <= 0 and sinfo["fetchlocal"] == None:
+        elif not fetch_url(mysession, url_to_fetch, tempfile):
             logme("Failed to fetch", url_to_fetch, "error")
             continue
 
@@ -720,7 +703,7 @@ def hapi_info_to_catdata(dataid, hapiurl):
     catalogkeys = fetch_catalogkeys()
 
     headers = {"Accept": "application/json"}
-    res = requests.get(hapiurl, headers=headers)
+    res = httpclient.get(hapiurl, headers=headers)
     if res.status_code == 200:
         try:
             j = res.json()
@@ -0,0 +1,145 @@
+"""
+Shared fixtures for the CDAWeb fetching tests: a small synthetic
+all.xml and SPDF filelist, so the ingest/transfer steps run end to
+end without network access.
+"""
+import gzip
+import os
+import random
+import sys
+
+import pytest
+
+# the cdaweb tools import each other as top-level modules
+CDAWEB_DIR = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '../src/heliocloud_tools/fetching/cdaweb'))
+sys.path.insert(0, CDAWEB_DIR)
+
+import spdf_to_db  # noqa: E402
+
+LISTED = "2017-08-29T05:06:00.2723147540 GMT"
+
+
+def make_datasets(ndatasets=12, nirregular=3):
+    """Returns [(dataid, base, filenaming)], every third with a day-of-year
+    pattern and the irregular ones without the '_YYYY' in their names."""
+    datasets = []
+    for i in range(ndatasets):
+        pattern = f"m{i}_h0_inst_%Y%m%d_v%Q.cdf" if i % 3 else f"m{i}_h0_inst_%Y%j%H%M%S_v%Q.cdf"
+        datasets.append((f"M{i}_H0_INST", f"pub/data/m{i}/inst/h0", pattern))
+    for i in range(nirregular):
+        datasets.append((f"IRR{i}", f"pub/data/irr{i}/sub", f"irr{i}x%Y%m%d_v%Q.cdf"))
+    return datasets
+
+
+def write_allxml(fname, datasets):
+    ns = "http://cdaweb.gsfc.nasa.gov/schema"
+    xml = [f'<?xml version="1.0"?>\n<sites xmlns="{ns}"><datasite><name>x</name>']
+    for dataid, base, pattern in datasets:
+        xml.append(
+            f'<dataset serviceprovider_ID="{dataid}"><access filenaming="{pattern}">'
+            f'<URL>https://cdaweb.gsfc.nasa.gov/{base}/</URL></access></dataset>'
+        )
+    xml.append("</datasite></sites>")
+    with open(fname, "w") as fout:
+        fout.write("\n".join(xml))
+
+
+def file_name(pattern, year, k):
+    # the k'th file of a year for a filenaming pattern
+    if "%j" in pattern:
+        return pattern.replace("%Y%j%H%M%S", f"{year}{(k % 300) + 1:03d}120000").replace("%Q", "01")
+    return pattern.replace("%Y%m%d", f"{year}{(k % 12) + 1:02d}{(k % 27) + 1:02d}").replace("%Q", "01")
+
+
+def filelist_lines(datasets, nfiles=12, years=3, seed=1):
+    """Returns the sorted filelist lines, nfiles per dataset spread over
+    'years' years, plus an unknown dataset and a non-data file."""
+    rng = random.Random(seed)
+    lines = []
+    for dataid, base, pattern in datasets:
+        for k in range(nfiles):
+            year = 2000 + k % years
+            fullname = f"{base}/{year}/{file_name(pattern, year, k)}"
+            lines.append(f"{LISTED} {rng.randint(1000, 90000):>10} {fullname}")
+    lines.append(f"{LISTED}       1234 pub/data/unknown/thing/unk_h0_20010101_v01.cdf")
+    lines.append(f"{LISTED}       1234 pub/data/readme.txt")
+    return sorted(lines, key=lambda line: line.split()[-1])
+
+
+def write_filelist(fname, lines):
+    with gzip.open(fname, "wt") as fout:
+        fout.write("\n".join(lines) + "\n")
+
+
+def make_defaults(path, filelist="filelist.gz", **settings):
+    # default_defaults() for a DB, filelist and local prefixes under path
+    defaults = spdf_to_db.default_defaults(
+        filelist=str(path / filelist), dest_prefix=str(path / "dest") + "/")
+    defaults["db_name"] = str(path / "t.db")
+    defaults["staging_prefix"] = str(path / "stage") + "/"
+    defaults["source_prefix"] = str(path / "src") + "/"
+    defaults.update(settings)
+    return defaults
+
+
+def ingest(defaults):
+    # just the ingest step of prod()
+    spdf_to_db.prod(defaults, steps=[True, False, False, False, False])
+
+
+def statuses(db_name):
+    db_Conn, db_Cursor = spdf_to_db.connectDB(db_name, pool=False)
+    db_Cursor.execute("SELECT status, count(*) FROM entries GROUP BY status ORDER BY status;")
+    rows = db_Cursor.fetchall()
+    db_Conn.close()
+    return rows
+
+
+def make_sources(defaults, nfiles=None, missing=()):
+    """Writes a local source file for the first nfiles files to fetch
+    (by filename), each holding its fullname three times, except the
+    positions in 'missing'.  Returns [(fullname, filesize)] as listed."""
+    db_Conn, db_Cursor = spdf_to_db.connectDB(defaults["db_name"], pool=False)
+    query = "SELECT fullname, filesize FROM entries WHERE status=1 ORDER BY filename"
+    if nfiles != None:
+        query += f" LIMIT {nfiles}"
+    db_Cursor.execute(query)
+    rows = db_Cursor.fetchall()
+    db_Conn.close()
+    for i, (fullname, filesize) in enumerate(rows):
+        if i in missing:
+            continue
+        fname = os.path.join(defaults["source_prefix"], fullname)
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        with open(fname, "w") as fout:
+            fout.write(fullname * 3)
+    return rows
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    """A moto stand-in for S3 with source-bucket and dest-bucket, or the
+    test is skipped without moto."""
+    boto3 = pytest.importorskip("boto3")
+    moto = pytest.importorskip("moto")
+    for key in ["AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY", "AWS_SESSION_TOKEN"]:
+        monkeypatch.setenv(key, "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket="source-bucket")
+        client.create_bucket(Bucket="dest-bucket")
+        yield client
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """A scratch directory holding all.xml and filelist.gz, made the
+    current directory (the ingest reads all.xml from there)."""
+    datasets = make_datasets()
+    write_allxml(tmp_path / "all.xml", datasets)
+    write_filelist(tmp_path / "filelist.gz", filelist_lines(datasets))
+    monkeypatch.chdir(tmp_path)
+    yield tmp_path
+    spdf_to_db.closeDB_pool()
@@ -0,0 +1,48 @@
+"""
+Tests generate_catalog: which start and stop each catalog stub line
+gets for the dataset/years being refreshed.
+"""
+import sqlite3
+
+from conftest import make_defaults, ingest, spdf_to_db
+
+
+def catalog_lines(defaults, **kwargs):
+    # runs generate_catalog into a fresh stub, returning {dataid: (start, stop)}
+    spdf_to_db.generate_catalog(defaults, **kwargs)
+    lines = {}
+    with open(defaults["catalog_stub"]) as fin:
+        for line in fin:
+            dataid, start, stop, index, modstamp = line.strip().split(",")
+            lines[dataid] = (start, stop)
+    return lines
+
+
+def test_generate_catalog_start_stop(workdir):
+    """Over the refreshed dataset/years, start is the latest of their
+    first file starts and stop the latest file start, so refreshing
+    2001 and 2002 of a 2000-2002 dataset starts the stub in 2002."""
+    defaults = make_defaults(workdir, catalog_stub=str(workdir / "catalog.csv"))
+    ingest(defaults)
+    spdf_to_db.db_unsafe_mark_all_as_copied(defaults["db_name"])
+    db_Conn = sqlite3.connect(defaults["db_name"])
+    spans = {}
+    for queueset, first, last in db_Conn.execute(
+            "SELECT queueset, MIN(starttime), MAX(starttime) FROM entries "
+            "WHERE dataid='M1_H0_INST' GROUP BY queueset"):
+        spans[queueset] = (first, last)
+    db_Conn.execute("DELETE FROM refresh_indices")
+    db_Conn.executemany("INSERT INTO refresh_indices (dataid, year) VALUES (?, ?)",
+                        [("M1_H0_INST", 2001), ("M1_H0_INST", 2002)])
+    db_Conn.commit()
+    db_Conn.close()
+    assert sorted(spans) == ["M1_H0_INST:2000", "M1_H0_INST:2001", "M1_H0_INST:2002"]
+    assert spans["M1_H0_INST:2002"][0][:4] == "2002"
+
+    lines = catalog_lines(defaults)
+    assert lines == {"M1_H0_INST": (spans["M1_H0_INST:2002"][0], spans["M1_H0_INST:2002"][1])}
+
+    # all indices, the latest first start is still that of 2002
+    lines = catalog_lines(defaults, allindices=True)
+    assert lines["M1_H0_INST"] == (spans["M1_H0_INST:2002"][0], spans["M1_H0_INST:2002"][1])
+    assert len(lines) > 1
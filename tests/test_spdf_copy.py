@@ -0,0 +1,113 @@
+"""
+Tests smart_cp, the copy under every transfer: local to local, into S3
+and S3 to S3 (against moto), byte for byte.
+"""
+import os
+import random
+
+from conftest import spdf_to_db
+
+
+def copy_clients(dest, **prefs):
+    # transfer_clients() for copies from local disk to dest
+    defaults = spdf_to_db.default_defaults(dest_prefix=dest)
+    defaults.update(source_prefix="", staging_prefix=None, **prefs)
+    return spdf_to_db.transfer_clients(defaults)
+
+
+def binary_file(fname, nbytes, seed=3):
+    # random bytes with no line structure, including NULs and bare CRs
+    data = random.Random(seed).randbytes(nbytes)
+    with open(fname, "wb") as fout:
+        fout.write(data)
+    return data
+
+
+def test_smart_cp_local(tmp_path):
+    """Binary files copy byte for byte in buffer-sized chunks, through a
+    .partial that is renamed when complete."""
+    clients = copy_clients(str(tmp_path / "dest") + "/", copy_buffer_mb=1)
+    assert clients["bufsize"] == 1024 * 1024
+    for nbytes in [0, 1, 1024 * 1024, 3 * 1024 * 1024 + 17]:
+        source = str(tmp_path / f"source_{nbytes}.cdf")
+        data = binary_file(source, nbytes)
+        dest = str(tmp_path / "dest" / "a" / "b" / f"copy_{nbytes}.cdf")
+        assert spdf_to_db.smart_cp(source, dest, clients=clients)
+        with open(dest, "rb") as fin:
+            assert fin.read() == data
+    assert not [f for f in os.listdir(tmp_path / "dest" / "a" / "b") if f.endswith(".partial")]
+
+
+def test_smart_cp_gz_untouched(tmp_path):
+    """A .gz goes over as-is, not decompressed by its extension."""
+    source = str(tmp_path / "thing.txt.gz")
+    data = binary_file(source, 5000)
+    dest = str(tmp_path / "out" / "thing.txt.gz")
+    assert spdf_to_db.smart_cp(source, dest, clients=copy_clients(str(tmp_path / "out") + "/"))
+    with open(dest, "rb") as fin:
+        assert fin.read() == data
+
+
+def test_smart_cp_missing_source(tmp_path):
+    """A failed copy returns False and leaves nothing under the real name."""
+    dest = str(tmp_path / "out" / "never.cdf")
+    assert not spdf_to_db.smart_cp(str(tmp_path / "missing.cdf"), dest)
+    assert not os.path.exists(dest)
+
+
+def test_smart_cp_s3_multipart(tmp_path, s3):
+    """Into S3 a file over 's3_part_mb' goes up as a multipart upload,
+    and smaller ones as a single put, all byte for byte."""
+    clients = copy_clients("s3://dest-bucket/data/", s3_part_mb=5, s3_upload_threads=2)
+    for nbytes in [1000, 12 * 1024 * 1024 + 5]:
+        source = str(tmp_path / f"source_{nbytes}.cdf")
+        data = binary_file(source, nbytes)
+        key = f"data/copy_{nbytes}.cdf"
+        assert spdf_to_db.smart_cp(source, "s3://dest-bucket/" + key, clients=clients)
+        head = s3.head_object(Bucket="dest-bucket", Key=key)
+        assert s3.get_object(Bucket="dest-bucket", Key=key)["Body"].read() == data
+        # a multipart ETag carries its part count
+        assert head["ETag"].strip('"').endswith("-3") == (nbytes > 5 * 1024 * 1024)
+
+
+def test_transfer_s3_server_copy(tmp_path, s3, monkeypatch):
+    """S3 to S3, transfer_over copies server-side straight to dest_prefix
+    (staging_prefix None): small files by copy_object, the big one by a
+    multipart copy of 5MB parts, all held and byte for byte."""
+    defaults = spdf_to_db.default_defaults(dest_prefix="s3://dest-bucket/spdf/cdaweb/data/")
+    defaults["db_name"] = str(tmp_path / "s3_copy.db")
+    defaults["source_prefix"] = "s3://source-bucket/pub/data/"
+    defaults["staging_prefix"] = None
+    defaults["s3_part_mb"] = 5
+    rows = []
+    for i in range(20):
+        filename = f"ac_h0_mfi_200101{i+1:02d}_v01.cdf"
+        fullname = f"ace/mag/level_2_cdaweb/mfi_h0/2001/{filename}"
+        body = random.Random(i).randbytes(12 * 1024 * 1024 if i == 0 else 1000 + i)
+        s3.put_object(Bucket="source-bucket", Key="pub/data/" + fullname, Body=body)
+        rows.append((filename, fullname, len(body), f"2001-01-{i+1:02d}T00:00:00Z",
+                     "AC_H0_MFI", "AC_H0_MFI:2001", 1))
+    spdf_to_db.createDB_safe(defaults["db_name"])
+    spdf_to_db.updateDB_all_defaults(defaults)
+    db_Conn, db_Cursor = spdf_to_db.connectDB(defaults["db_name"], pool=False)
+    spdf_to_db.insertDB_many(db_Cursor, rows)
+    db_Conn.commit()
+    db_Conn.close()
+
+    def streamed(*args, **kwargs):
+        raise AssertionError("S3 to S3 bytes came through smart_open")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(spdf_to_db.smart_open, "open", streamed)
+        spdf_to_db.transfer_over(defaults["db_name"])
+    for row in rows:
+        got = s3.get_object(Bucket="dest-bucket", Key="spdf/cdaweb/data/" + row[1])
+        want = s3.get_object(Bucket="source-bucket", Key="pub/data/" + row[1])
+        assert got["Body"].read() == want["Body"].read()
+    big = s3.head_object(Bucket="dest-bucket", Key="spdf/cdaweb/data/" + rows[0][1])
+    assert big["ETag"].strip('"').endswith("-3")
+    assert "None" not in str(s3.list_objects_v2(Bucket="dest-bucket")["Contents"])
+    db_Conn, db_Cursor = spdf_to_db.connectDB(defaults["db_name"], pool=False)
+    db_Cursor.execute("SELECT COUNT(*) FROM entries WHERE status=0")
+    assert db_Cursor.fetchone()[0] == len(rows)
+    db_Conn.close()
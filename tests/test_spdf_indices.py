@@ -0,0 +1,71 @@
+"""
+Tests generate_indices and the index text builders it can use.
+"""
+import os
+
+import pytest
+
+from conftest import make_defaults, make_sources, ingest, spdf_to_db
+
+DEST = "s3://gov-nasa-hdrl-data1/spdf/cdaweb/data/"
+
+
+def queueset_rows(g, groupsize):
+    # one queueset's (fullname, filename, filesize, starttime), newest first
+    rows = []
+    for i in range(groupsize):
+        filename = f"mms1_fpi_brst_l2_des-moms_{g:05d}{i:07d}_v3.4.0.cdf"
+        rows.append((f"mms/mms1/fpi/brst/l2/des-moms/2019/01/{filename}", filename,
+                     100000 + i, f"2019-01-{1 + i % 28:02d}T{i % 24:02d}:{i % 60:02d}:00Z"))
+    rows.reverse()
+    return rows
+
+
+@pytest.mark.parametrize("name", ["columnar", "pandas"])
+@pytest.mark.parametrize("groupsize", [1, 10, 365])
+def test_index_builders_agree(name, groupsize):
+    """Every builder gives rowwise_index_text's text: oldest first, each
+    file stopping where the next starts and the last at its own start."""
+    if name == "pandas":
+        pytest.importorskip("pandas")
+    builder = spdf_to_db.index_builders()[name]
+    for g in range(3):
+        rows = queueset_rows(g, groupsize)
+        assert builder(rows, DEST) == spdf_to_db.rowwise_index_text(rows, DEST)
+    text = spdf_to_db.rowwise_index_text(rows, DEST).splitlines()
+    assert len(text) == groupsize
+    assert text[-1].split(",")[:2] == [rows[0][3], rows[0][3]]
+    if groupsize > 1:
+        assert text[0].split(",")[:2] == [rows[-1][3], rows[-2][3]]
+    assert text[0].split(",")[2] == DEST + rows[-1][0]
+
+
+def index_files(path):
+    # {relative name: content} of every index under path
+    found = {}
+    for root, dirs, files in os.walk(path):
+        for fname in files:
+            if not fname.endswith(".csv"):
+                continue
+            full = os.path.join(root, fname)
+            with open(full) as fin:
+                found[os.path.relpath(full, path)] = fin.read()
+    return found
+
+
+def test_generate_indices_builders(workdir):
+    """After a transfer, generate_indices writes the same index files
+    whichever builder it uses."""
+    written = {}
+    for name in ["rowwise", "columnar"]:
+        defaults = make_defaults(workdir, index_builder=name, index_skip_unchanged=False)
+        defaults["db_name"] = str(workdir / f"{name}.db")
+        defaults["staging_prefix"] = str(workdir / name) + "/"
+        ingest(defaults)
+        make_sources(defaults)
+        spdf_to_db.transfer_over(defaults["db_name"])
+        errorcount, track_indices = spdf_to_db.generate_indices(defaults)
+        assert errorcount == 0 and len(track_indices) > 10
+        written[name] = index_files(workdir / name)
+    assert len(written["rowwise"]) > 10
+    assert written["columnar"] == written["rowwise"]
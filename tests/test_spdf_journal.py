@@ -0,0 +1,106 @@
+"""
+Tests the transfer journal: a restarted transfer_over or ingest picks up
+what a killed one finished, and a big S3 upload resumes from its parts.
+"""
+import os
+import random
+import sqlite3
+
+from conftest import make_defaults, make_sources, ingest, statuses, spdf_to_db
+
+
+def journal_done(db_name, rows):
+    # journals rows as copied, as a transfer killed before its checkpoint would
+    jConn = spdf_to_db.journal_open(db_name)
+    for fullname, filesize in rows:
+        spdf_to_db.journal_mark(jConn, fullname, filesize, "done")
+    jConn.close()
+
+
+def test_journal_skips_done(workdir):
+    """Files journaled 'done' are held without being copied again, even
+    with their sources gone, and the journal is cleared after."""
+    defaults = make_defaults(workdir, transfer_journal=True)
+    ingest(defaults)
+    rows = make_sources(defaults, nfiles=30)
+    done = rows[::3]
+    journal_done(defaults["db_name"], done)
+    for fullname, filesize in done:
+        os.remove(os.path.join(defaults["source_prefix"], fullname))
+    spdf_to_db.transfer_over(defaults["db_name"], limit=len(rows))
+    db_Conn = sqlite3.connect(defaults["db_name"])
+    held = set(db_Conn.execute("SELECT fullname, filesize FROM entries WHERE status=0"))
+    db_Conn.close()
+    assert held == set(rows)
+    for fullname, filesize in done:
+        assert not os.path.exists(os.path.join(defaults["staging_prefix"], fullname))
+    jConn = spdf_to_db.journal_open(defaults["db_name"])
+    assert jConn.execute("SELECT COUNT(*) FROM transfers").fetchone()[0] == 0
+    jConn.close()
+
+
+def test_journal_settled_on_ingest(workdir):
+    """An ingest after a killed transfer_over marks the journaled copies
+    held and queues their dataset/years for reindexing, then empties the
+    journal, so a rerun never refetches them."""
+    defaults = make_defaults(workdir, transfer_journal=True)
+    ingest(defaults)
+    rows = make_sources(defaults, nfiles=10)
+    before = dict(statuses(defaults["db_name"]))
+    journal_done(defaults["db_name"], rows)
+    spdf_to_db.db_clear_refresh_indices(defaults["db_name"])
+    ingest(defaults)
+    after = dict(statuses(defaults["db_name"]))
+    assert after.get(0, 0) == before.get(0, 0) + len(rows)
+    assert after[1] == before[1] - len(rows)
+    db_Conn = sqlite3.connect(defaults["db_name"])
+    queued = db_Conn.execute("SELECT COUNT(*) FROM refresh_indices").fetchone()[0]
+    db_Conn.close()
+    assert queued > 0
+    jConn = spdf_to_db.journal_open(defaults["db_name"])
+    assert jConn.execute("SELECT COUNT(*) FROM transfers").fetchone()[0] == 0
+    jConn.close()
+
+
+class PartCounter:
+    # an S3 client that counts the parts it is sent
+    def __init__(self, client):
+        self.client = client
+        self.parts = []
+
+    def upload_part(self, **kwargs):
+        self.parts.append(kwargs["PartNumber"])
+        return self.client.upload_part(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+def test_journal_resumes_upload(tmp_path, s3):
+    """A big upload killed after its first parts continues from the
+    UploadId in the journal, sending only the parts S3 lacks."""
+    partsize = 5 * 1024 * 1024
+    data = random.Random(5).randbytes(3 * partsize + 1234)
+    source = str(tmp_path / "big.cdf")
+    with open(source, "wb") as fout:
+        fout.write(data)
+    db_name = str(tmp_path / "t.db")
+    fullname, key = "big/big.cdf", "data/big/big.cdf"
+    # the killed attempt: two parts up, UploadId journaled
+    upload_id = s3.create_multipart_upload(Bucket="dest-bucket", Key=key)["UploadId"]
+    for number in [1, 2]:
+        s3.upload_part(Bucket="dest-bucket", Key=key, UploadId=upload_id, PartNumber=number,
+                       Body=data[(number - 1) * partsize:number * partsize])
+    jConn = spdf_to_db.journal_open(db_name)
+    spdf_to_db.journal_mark(jConn, fullname, len(data), "inflight", upload_id, partsize)
+
+    clients = {"s3": PartCounter(s3), "journal": jConn, "partsize": partsize, "resume_min": partsize}
+    assert spdf_to_db.journal_cp(source, "s3://dest-bucket/" + key, fullname, len(data), clients=clients)
+    assert clients["s3"].parts == [3, 4]
+    assert s3.get_object(Bucket="dest-bucket", Key=key)["Body"].read() == data
+    assert spdf_to_db.journal_get(jConn, fullname, len(data))[:2] == ("done", None)
+    # and done is done: no second copy
+    assert spdf_to_db.journal_cp(source + ".gone", "s3://dest-bucket/" + key, fullname, len(data),
+                                 clients=clients)
+    assert clients["s3"].parts == [3, 4]
+    jConn.close()
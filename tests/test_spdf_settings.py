@@ -0,0 +1,40 @@
+"""
+Tests the settings table of spdf_to_db: what updateDB_defaults stores
+is what fetchDB_defaults hands back.
+"""
+import sqlite3
+
+from conftest import make_defaults, spdf_to_db
+
+
+def test_settings_round_trip(workdir):
+    """None, numbers, bools and quoted strings come back as they went in."""
+    defaults = make_defaults(workdir, staging_prefix=None, transfer_cap_gb=1.5,
+                             force_uppercase=False, rate_limits="it's/10")
+    spdf_to_db.createDB_safe(defaults["db_name"])
+    spdf_to_db.updateDB_all_defaults(defaults)
+    stored = spdf_to_db.fetchDB_defaults(defaults["db_name"])
+    assert stored["staging_prefix"] is None
+    assert stored["transfer_cap_gb"] == 1.5
+    assert not stored["force_uppercase"]
+    assert stored["rate_limits"] == "it's/10"
+    assert stored["transfer_workers"] == defaults["transfer_workers"]
+    assert stored["dest_prefix"] == defaults["dest_prefix"]
+
+    spdf_to_db.updateDB_defaults(defaults["db_name"], "staging_prefix", "s3://b/x/")
+    assert spdf_to_db.fetchDB_defaults(defaults["db_name"])["staging_prefix"] == "s3://b/x/"
+    spdf_to_db.updateDB_defaults(defaults["db_name"], "staging_prefix", None)
+    assert spdf_to_db.fetchDB_defaults(defaults["db_name"])["staging_prefix"] is None
+
+
+def test_settings_legacy_none(workdir):
+    """An older DB holding the string 'None' reads back as None."""
+    defaults = make_defaults(workdir)
+    spdf_to_db.createDB_safe(defaults["db_name"])
+    spdf_to_db.updateDB_all_defaults(defaults)
+    spdf_to_db.closeDB_pool()
+    db_Conn = sqlite3.connect(defaults["db_name"])
+    db_Conn.execute("UPDATE settings SET staging_prefix = 'None' WHERE id=1")
+    db_Conn.commit()
+    db_Conn.close()
+    assert spdf_to_db.fetchDB_defaults(defaults["db_name"])["staging_prefix"] is None
@@ -0,0 +1,126 @@
+"""
+Tests the transfer side of spdf_to_db: transfer_over, its dry-run
+projection and run_queue, copying local files into a local staging area.
+"""
+import sqlite3
+import threading
+
+import pytest
+
+from conftest import make_defaults, make_sources, ingest, spdf_to_db
+
+
+def test_transfer_dryrun(workdir):
+    """transfer_dryrun reports every policy on a small DB, and with no
+    cap in reach every file and dataset/year is projected as done."""
+    defaults = make_defaults(workdir, transfer_cap_gb=100, transfer_workers=2)
+    ingest(defaults)
+    report = spdf_to_db.transfer_dryrun(defaults["db_name"], debug=False)
+    assert sorted(report) == ["balanced", "filename", "queueset", "shortest"]
+    db_Conn = sqlite3.connect(defaults["db_name"])
+    nfiles, nbytes, nsets = db_Conn.execute(
+        "SELECT count(*), sum(filesize), count(DISTINCT queueset) FROM entries WHERE status=1").fetchone()
+    db_Conn.close()
+    assert nfiles > 0
+    for files, gb, sets, hours in report.values():
+        assert (files, sets) == (nfiles, nsets)
+        assert abs(gb - nbytes / 1e9) < 1e-9
+        assert hours > 0
+
+
+def held(db_name):
+    # the (fullname, filesize) of every held file
+    db_Conn = sqlite3.connect(db_name)
+    rows = set(db_Conn.execute("SELECT fullname, filesize FROM entries WHERE status=0"))
+    db_Conn.close()
+    return rows
+
+
+@pytest.mark.parametrize("policy", ["filename", "shortest", "queueset", "balanced"])
+def test_transfer_dryrun_matches_cap(workdir, policy):
+    """What transfer_dryrun projects under a cap is exactly what a real
+    transfer_over with several workers then holds: the same files, the
+    same bytes and the same finished dataset/years."""
+    defaults = make_defaults(workdir, transfer_workers=4, transfer_schedule=policy)
+    ingest(defaults)
+    rows = make_sources(defaults)
+    total = sum(filesize for fullname, filesize in rows)
+    defaults["transfer_cap_gb"] = total / 3 / 1e9
+    spdf_to_db.updateDB_all_defaults(defaults)
+
+    report = spdf_to_db.transfer_dryrun(defaults["db_name"], policies=[policy], debug=False)
+    db_Conn, db_Cursor = spdf_to_db.connectDB(defaults["db_name"], pool=False)
+    db_Cursor.execute(spdf_to_db.transfer_query())
+    projected = spdf_to_db.capped_transfers(
+        spdf_to_db.schedule_transfers(db_Cursor.fetchall(), policy), defaults["transfer_cap_gb"])
+    db_Conn.close()
+
+    spdf_to_db.transfer_over(defaults["db_name"], checkpoint=7)
+    copied = held(defaults["db_name"])
+    assert copied == {(row[2], row[3]) for row in projected}
+    files, gb, nsets, hours = report[policy]
+    assert 0 < files < len(rows)
+    assert files == len(copied)
+    assert abs(gb - sum(filesize for fullname, filesize in copied) / 1e9) < 1e-9
+    db_Conn = sqlite3.connect(defaults["db_name"])
+    finished = db_Conn.execute(
+        "SELECT count(DISTINCT queueset) FROM entries WHERE queueset NOT IN "
+        "(SELECT queueset FROM entries WHERE status=1)").fetchone()[0]
+    db_Conn.close()
+    assert nsets == finished
+
+
+def capped_run(workdir, name, workers, cap_gb, missing):
+    # transfer_over on a fresh copy of the DB, returning what it held
+    defaults = make_defaults(workdir, transfer_workers=workers, transfer_cap_gb=cap_gb)
+    defaults["db_name"] = str(workdir / name)
+    ingest(defaults)
+    make_sources(defaults, missing=missing)
+    spdf_to_db.transfer_over(defaults["db_name"], checkpoint=5)
+    return held(defaults["db_name"])
+
+
+def test_transfer_cap_workers(workdir):
+    """With failing copies freeing their share of the cap, 8 workers stop
+    at the same file as a serial run, and the held bytes stay within the
+    cap plus the one file that crosses it."""
+    missing = set(range(3, 180, 9))
+    defaults = make_defaults(workdir)
+    ingest(defaults)
+    total = sum(filesize for fullname, filesize in make_sources(defaults))
+    cap = total / 4 / 1e9
+    serial = capped_run(workdir, "serial.db", 1, cap, missing)
+    pooled = capped_run(workdir, "pooled.db", 8, cap, missing)
+    assert pooled == serial
+    held_bytes = sum(filesize for fullname, filesize in pooled)
+    assert cap * 1e9 < held_bytes <= cap * 1e9 + max(filesize for fullname, filesize in pooled)
+
+
+def run_bounded(target, seconds=60):
+    # runs target() in a thread, failing rather than hanging the tests
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(seconds)
+    assert not thread.is_alive(), "transfer_over did not return"
+
+
+def test_transfer_worker_errors(workdir, monkeypatch):
+    """A worker whose journal raises, or whose clients cannot be built,
+    still answers for every job, so transfer_over returns: journal
+    errors leave the files to fetch, client errors fall back to smart_cp."""
+    defaults = make_defaults(workdir, transfer_workers=4, transfer_journal=True)
+    ingest(defaults)
+    rows = make_sources(defaults, nfiles=20)
+
+    def locked(*args, **kwargs):
+        raise sqlite3.OperationalError("database is locked")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(spdf_to_db, "journal_mark", locked)
+        run_bounded(lambda: spdf_to_db.transfer_over(defaults["db_name"], limit=20))
+    assert held(defaults["db_name"]) == set()
+
+    with monkeypatch.context() as patch:
+        patch.setattr(spdf_to_db, "transfer_clients", locked)
+        run_bounded(lambda: spdf_to_db.transfer_over(defaults["db_name"], limit=20))
+    assert held(defaults["db_name"]) == set(rows)
@@ -0,0 +1,93 @@
+"""
+Tests the all.xml cache of cdaweb_xml_checker.load_fromxml: that it is
+used when valid and re-parsed when stale, of another version or junk.
+"""
+import json
+import os
+
+import pytest
+
+from conftest import make_datasets, write_allxml
+import cdaweb_xml_checker as cxc
+
+
+@pytest.fixture
+def allxml(tmp_path, monkeypatch):
+    # an all.xml with nothing memoized, and a parse counter
+    write_allxml(tmp_path / "all.xml", make_datasets())
+    monkeypatch.setattr(cxc, "global_xml_memo", {})
+    parses = []
+    parse_allxml = cxc.parse_allxml
+
+    def counted(*args, **kwargs):
+        parses.append(args)
+        return parse_allxml(*args, **kwargs)
+
+    monkeypatch.setattr(cxc, "parse_allxml", counted)
+    return tmp_path, parses
+
+
+def reload(path):
+    # load_fromxml as a fresh run would, with nothing memoized
+    cxc.global_xml_memo.clear()
+    return cxc.load_fromxml(str(path))
+
+
+def test_cache_round_trip(allxml):
+    """The JSON cache gives back the parsed maps, with no second parse."""
+    path, parses = allxml
+    maps = reload(path)
+    assert len(parses) == 1
+    cachename = cxc.xml_cache_name(str(path / "all.xml"))
+    assert cachename.endswith(".json")
+    with open(cachename) as fin:
+        assert json.load(fin)["version"] == cxc.xml_cache_version
+    assert reload(path) == maps
+    assert len(parses) == 1
+    # another strip_me is its own entry, and leaves the first one usable
+    cxc.global_xml_memo.clear()
+    stripped = cxc.load_fromxml(str(path), strip_me="pub/")
+    assert stripped[0]["M1_H0_INST"] == "data/m1/inst/h0/"
+    assert reload(path) == maps
+    assert len(parses) == 2
+
+
+def test_cache_version_mismatch(allxml, monkeypatch):
+    """A cache written under another xml_cache_version is re-parsed, and
+    the memo of the old version is not reused either."""
+    path, parses = allxml
+    maps = cxc.load_fromxml(str(path))
+    monkeypatch.setattr(cxc, "xml_cache_version", cxc.xml_cache_version + 1)
+    assert cxc.load_fromxml(str(path)) == maps
+    assert len(parses) == 2
+    assert reload(path) == maps
+    assert len(parses) == 2
+
+
+@pytest.mark.parametrize("junk", ["", "not json", "[]", '{"version": %d}' % cxc.xml_cache_version,
+                                  '{"version": %d, "maps": {"null": 7}}' % cxc.xml_cache_version])
+def test_cache_junk_ignored(allxml, junk):
+    """A corrupt or foreign cache file is ignored and rewritten."""
+    path, parses = allxml
+    maps = reload(path)
+    with open(cxc.xml_cache_name(str(path / "all.xml")), "w") as fout:
+        fout.write(junk)
+    assert reload(path) == maps
+    assert len(parses) == 2
+    assert reload(path) == maps
+    assert len(parses) == 2
+
+
+def test_cache_stale(allxml):
+    """A changed all.xml is re-parsed; one only touched is not."""
+    path, parses = allxml
+    reload(path)
+    fname = path / "all.xml"
+    stat = os.stat(fname)
+    os.utime(fname, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    reload(path)
+    assert len(parses) == 1
+    write_allxml(fname, make_datasets(ndatasets=5))
+    regex_base, regex_pattern = reload(path)
+    assert len(parses) == 2
+    assert "M7_H0_INST" not in regex_base
@@ -0,0 +1,145 @@
+"""
+Tests the filename lookups of cdaweb_xml_checker: fast_extract_datetime
+against extract_datetime, and the path trie against the linear scan.
+"""
+import random
+from datetime import datetime
+
+import pytest
+
+import conftest  # noqa: F401, puts the cdaweb tools on sys.path
+import cdaweb_xml_checker as cxc
+
+PATTERNS = [
+    "ac_h0_mfi_%Y%m%d_v%Q.cdf",
+    "i1_av_odg_%Y%j%H%M%S_v%Q.cdf",
+    "mms1_fpi_brst_l2_des-moms_%Y%m%d%H%M%S_v%Q.cdf",
+    "po_k0_uvi_%Y%m%d%H_v%Q.cdf",
+    "wi_h1_swe_%Y%j_v%Q.cdf",
+    "themis_%Y_v%Q.cdf",
+    "no_time_fields_v%Q.cdf",
+]
+
+
+def legacy_str(filename, regex_pattern):
+    # extract_datetime's answer formatted as form="str" was before it went
+    # fast, except years before 1000 are always zero padded (strftime's %Y
+    # pads them on some platforms only, glibc does not)
+    dt = cxc.extract_datetime(filename, regex_pattern)
+    if isinstance(dt, datetime):
+        return f"{dt.year:04d}" + dt.strftime("-%m-%dT%H:%M:%SZ")
+    return dt
+
+
+def fill(pattern, rng, valid):
+    # a filename for pattern, its fields in or (if not valid) maybe out of range
+    top = {"%Y": 2030, "%m": 12, "%d": 28, "%j": 365, "%H": 23, "%M": 59, "%S": 59}
+    bad = {"%Y": 9999, "%m": 99, "%d": 99, "%j": 999, "%H": 99, "%M": 99, "%S": 99}
+    low = {"%Y": 1000, "%m": 1, "%d": 1, "%j": 1, "%H": 0, "%M": 0, "%S": 0}
+    width = {"%Y": 4, "%j": 3}
+    name = pattern.replace("%Q", "01")
+    for field in top:
+        hi = top[field] if valid else bad[field]
+        lo = low[field] if valid else 0
+        name = name.replace(field, f"{rng.randint(lo, hi):0{width.get(field, 2)}d}")
+    return name
+
+
+@pytest.mark.parametrize("valid", [True, False])
+def test_fast_extract_datetime(valid):
+    """fast_extract_datetime gives extract_datetime's answer as a string,
+    including None for impossible dates and names that do not match."""
+    rng = random.Random(7)
+    nones = 0
+    for pattern in PATTERNS:
+        regex = cxc.strftime_to_regex(pattern)
+        for i in range(400):
+            name = fill(pattern, rng, valid)
+            if i % 5 == 0:
+                name = name.upper()  # the case-insensitive fallback
+            fast = cxc.fast_extract_datetime(name, regex)
+            assert fast == legacy_str(name, regex), (pattern, name)
+            assert cxc.extract_datetime(name, regex, form="str") == fast
+            nones += fast == None
+    if valid:
+        assert nones == 0
+    else:
+        assert nones > 0
+
+
+@pytest.mark.parametrize("name, pattern, expected", [
+    ("ac_h0_mfi_20000229_v01.cdf", "ac_h0_mfi_%Y%m%d_v%Q.cdf", "2000-02-29T00:00:00Z"),
+    ("ac_h0_mfi_19000229_v01.cdf", "ac_h0_mfi_%Y%m%d_v%Q.cdf", None),
+    ("ac_h0_mfi_20011301_v01.cdf", "ac_h0_mfi_%Y%m%d_v%Q.cdf", None),
+    ("ac_h0_mfi_00000101_v01.cdf", "ac_h0_mfi_%Y%m%d_v%Q.cdf", None),
+    ("ac_h0_mfi_05390314_v01.cdf", "ac_h0_mfi_%Y%m%d_v%Q.cdf", "0539-03-14T00:00:00Z"),
+    ("wi_h1_swe_2004366_v01.cdf", "wi_h1_swe_%Y%j_v%Q.cdf", "2004-12-31T00:00:00Z"),
+    ("i1_av_odg_1969345140242_v01.cdf", "i1_av_odg_%Y%j%H%M%S_v%Q.cdf", "1969-12-11T14:02:42Z"),
+    ("i1_av_odg_1969345246060_v01.cdf", "i1_av_odg_%Y%j%H%M%S_v%Q.cdf", None),
+    ("something_else.cdf", "ac_h0_mfi_%Y%m%d_v%Q.cdf", None),
+    ("ac_h0_mfi_20000229_v01.cdf", "", None),
+])
+def test_fast_extract_datetime_cases(name, pattern, expected):
+    regex = cxc.strftime_to_regex(pattern) if pattern else pattern
+    assert cxc.fast_extract_datetime(name, regex) == expected
+    assert legacy_str(name, regex) == expected
+
+
+def synthetic_bases(ndatasets=300):
+    # irregularly named datasets (so extract_regex's '_YYYY' shortcut never
+    # applies), every tenth with a second base nested inside its own
+    regex_base, regex_pattern = {}, {}
+    for i in range(ndatasets):
+        base = f"mission{i % 15}/inst{i % 7}/level{i % 3}/set{i}"
+        regex_base[f"SET{i}"] = base
+        regex_pattern[f"SET{i}"] = cxc.strftime_to_regex(f"set{i}x%Y%m%d_v%Q.cdf")
+        if i % 10 == 0:
+            regex_base[f"SET{i}N"] = base + "/nested"
+            regex_pattern[f"SET{i}N"] = cxc.strftime_to_regex(f"set{i}x%Y%m%d_v%Q.cdf")
+    return regex_base, regex_pattern
+
+
+def test_trie_matches_linear():
+    """trie_extract_regex finds what slow_extract_regex does, except where
+    the linear scan stops at an outer base and the trie goes on to the
+    base nested inside it."""
+    regex_base, regex_pattern = synthetic_bases()
+    cxc.compile_patterns(regex_pattern)
+    rng = random.Random(42)
+    keys = list(regex_base)
+    same = nested = 0
+    for j in range(5000):
+        dataid = rng.choice(keys)
+        i = int(dataid[3:].rstrip("N"))
+        name = f"{regex_base[dataid]}/{2000 + j % 20}/set{i}x{2000 + j % 20}0101_v01.cdf"
+        trie = cxc.trie_extract_regex(regex_base, regex_pattern, name)
+        slow = cxc.slow_extract_regex(dict(regex_base), dict(regex_pattern), name)
+        assert trie[0] == dataid
+        if trie == slow:
+            same += 1
+        else:
+            assert regex_base[trie[0]].startswith(regex_base[slow[0]] + "/"), name
+            nested += 1
+    assert same > 0 and nested > 0
+    assert cxc.trie_extract_regex(regex_base, regex_pattern, "mission0/elsewhere/x_v01.cdf") == (None, None, None)
+
+
+def test_trie_whole_components():
+    """The longest base wins whatever the order, and bases match whole
+    path components, so 'a/set1' does not claim 'a/set10/'."""
+    regex_pattern = {key: cxc.strftime_to_regex("set1x%Y%m%d_v%Q.cdf") for key in ["OUTER", "INNER", "SET10"]}
+    regex_base = {"OUTER": "a/set1", "INNER": "a/set1/in", "SET10": "a/set10"}
+    assert cxc.trie_extract_regex(regex_base, regex_pattern, "a/set1/in/2001/set1x20010101_v01.cdf")[0] == "INNER"
+    assert cxc.trie_extract_regex(regex_base, regex_pattern, "a/set1/2001/set1x20010101_v01.cdf")[0] == "OUTER"
+    assert cxc.trie_extract_regex(regex_base, regex_pattern, "a/set10/2001/set1x20010101_v01.cdf")[0] == "SET10"
+    assert cxc.slow_extract_regex(dict(regex_base), dict(regex_pattern),
+                                  "a/set10/2001/set1x20010101_v01.cdf")[0] == "OUTER"
+
+
+def test_trie_follows_guesses():
+    """A dataid extract_regex guesses and adds is found by the trie next time."""
+    regex_base, regex_pattern = synthetic_bases(20)
+    name = "newmission/inst/2001/newm_h0_20010101_v01.cdf"
+    assert cxc.trie_extract_regex(regex_base, regex_pattern, name)[0] == None
+    assert cxc.extract_regex(regex_base, regex_pattern, name)[0] == "NEWM_H0"
+    assert cxc.trie_extract_regex(regex_base, regex_pattern, name)[:2] == ("NEWM_H0", "newmission/inst/2001")